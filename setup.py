@@ -7,4 +7,5 @@ setup(
     author="Adam Mesha",
     packages=['workqueue', 'queueworker'],
     package_dir={'': 'src'},
+    python_requires='>=3.7',
 )
@@ -6,6 +6,7 @@ from .worker import Worker
 
 DEFAULT_URL = 'http://localhost:5000/api'
 DEFAULT_DELAY = 5
+DEFAULT_MAX_DELAY = 60
 DEFAULT_LOGFILE = Path('./worker_log.txt')
 
 
@@ -19,8 +20,13 @@ def get_args():
              '(default {}).'.format(DEFAULT_URL))
     parser.add_argument(
         '--delay', '-d', default=DEFAULT_DELAY, type=float,
-        help='Time in seconds to wait between tasks '
-             '(default {}).'.format(DEFAULT_DELAY))
+        help='Time in seconds to wait before asking for tasks again '
+             'when there are none, doubled each time there are still '
+             'none (default {}).'.format(DEFAULT_DELAY))
+    parser.add_argument(
+        '--max-delay', '-m', default=DEFAULT_MAX_DELAY, type=float,
+        help='Maximum time in seconds to wait before asking for tasks '
+             'again (default {}).'.format(DEFAULT_MAX_DELAY))
     parser.add_argument(
         '--logfile', '-f', default=DEFAULT_LOGFILE,
         type=Path,
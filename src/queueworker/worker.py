@@ -1,3 +1,6 @@
+import os
+import signal
+import threading
 import time
 from pathlib import Path
 
@@ -8,57 +11,181 @@ class Worker(object):
     """Simple worker to process tasks."""
 
     timestamp_format = '%Y-%m-%dT%H:%M:%S'
+    # time in seconds to wait for the server before giving up on a request
+    timeout = 30
+    # maximum number of tasks to retrieve from the server at once
+    batch_size = 16
+    # log lines are buffered and written out every log_flush_interval
+    # seconds, or as soon as log_flush_lines lines are waiting
+    log_flush_interval = 0.5
+    log_flush_lines = 64
 
-    def __init__(self, url, delay, logfile):
+    def __init__(self, url, delay, logfile, max_delay=60):
         """Initialize a new worker to process tasks.
 
         Args:
             url: base API url for retrieving and reporting on tasks
-            delay: time in seconds to wait between tasks
+            delay: time in seconds to wait before asking for tasks again
+                when there are none, doubled each time there are still
+                none
             logfile: log file to write completed tasks to
+            max_delay: maximum time in seconds to wait before asking for
+                tasks again
         """
         self.url = url
         self.delay = delay
+        self.max_delay = max_delay
         self.logfile = Path(logfile)
         self.next_url = self.url + '/next'
         self.complete_url = self.url + '/complete'
         self.cur_task = None
+        # reuse a single session so that connections to the server are
+        # kept alive between requests
+        self.session = requests.Session()
+        # ids of processed tasks not yet reported complete
+        self._completed = []
+        # current time to wait when there are no tasks
+        self._backoff = 0
+        self._log_fp = self._open_logfile()
+        self._log_buffer = []
+        self._log_lock = threading.Lock()
+        self._reopen_log = False
+        self._stop = threading.Event()
+        self._flusher = None
+        self._last_timestamp = (None, None)
 
     def current_timestamp(self):
-        return time.strftime(self.timestamp_format, time.gmtime())
+        # The timestamp only changes once a second, so reuse the last
+        # formatted one until then.  The (second, timestamp) pair is
+        # replaced as a whole, so this is safe to call from any thread.
+        now = int(time.time())
+        second, timestamp = self._last_timestamp
+        if now != second:
+            timestamp = time.strftime(self.timestamp_format,
+                                      time.gmtime(now))
+            self._last_timestamp = (now, timestamp)
+        return timestamp
+
+    def _open_logfile(self):
+        return self.logfile.open('a')
+
+    def reopen_logfile(self, *args):
+        """Reopen the log file, e.g. after it was rotated.
+
+        Installed by run() as the SIGHUP handler.  The file is actually
+        reopened by the next flush, so that this is safe to call at any
+        point in a signal handler.
+
+        """
+        self._reopen_log = True
 
     def writeline(self, line):
+        """Add a line to the log, it is written out by the next flush."""
         full_line = '{timestamp}: {line}\n'.format(
             timestamp=self.current_timestamp(), line=line)
-        with self.logfile.open('a') as fp:
-            fp.write(full_line)
-
-    def get_task(self):
-        result = requests.get(self.next_url)
-        return result.json()['task']
-
-    def report_complete(self, id):
-        requests.post(self.complete_url, json=dict(id=id))
-
-    def process_next_task(self):
-        """Retrieve and process the next task and report its completion."""
-        task = self.get_task()
-        if task is not None:
-            payload = task['payload']
-            id = task['id']
-            self.writeline(payload)
-            self.report_complete(id)
-            print('Completed task {} with payload {!r}'.format(id, payload))
-        else:
+        with self._log_lock:
+            self._log_buffer.append(full_line)
+            full = len(self._log_buffer) >= self.log_flush_lines
+        if full:
+            self.flush_log()
+
+    def flush_log(self):
+        """Write out all buffered log lines and sync them to disk."""
+        with self._log_lock:
+            if self._reopen_log:
+                self._reopen_log = False
+                self._log_fp.close()
+                self._log_fp = self._open_logfile()
+            if not self._log_buffer:
+                return
+            self._log_fp.write(''.join(self._log_buffer))
+            self._log_buffer = []
+            self._log_fp.flush()
+            os.fsync(self._log_fp.fileno())
+
+    def _flush_log_periodically(self):
+        while not self._stop.wait(self.log_flush_interval):
+            self.flush_log()
+
+    def close(self):
+        """Close the log file and the connection to the server."""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush_log()
+        self._log_fp.close()
+        self.session.close()
+
+    def get_tasks(self):
+        """Retrieve a list of up to batch_size of the next tasks."""
+        result = self.session.get(self.next_url,
+                                  params=dict(n=self.batch_size),
+                                  timeout=self.timeout)
+        return result.json()['tasks']
+
+    def report_complete(self, ids):
+        self.session.post(self.complete_url, json=dict(ids=ids),
+                          timeout=self.timeout)
+
+    def report_completed_tasks(self):
+        """Report all tasks processed so far as complete."""
+        ids, self._completed = self._completed, []
+        if ids:
+            # make sure the tasks are logged before they are gone from
+            # the server
+            self.flush_log()
+            self.report_complete(ids)
+
+    def process_task(self, task):
+        """Process a single task."""
+        payload = task['payload']
+        id = task['id']
+        self.writeline(payload)
+        self._completed.append(id)
+        print('Completed task {} with payload {!r}'.format(id, payload))
+
+    def process_next_batch(self):
+        """Retrieve and process the next batch of tasks.
+
+        Completion is reported for the whole batch at once after all of
+        its tasks are processed.  This has to happen before the next
+        batch is requested, since the server will keep returning tasks
+        until they are reported complete.
+
+        If there are no tasks, wait before returning, for longer each
+        time this happens in a row.  The next batch is requested right
+        away otherwise.
+
+        """
+        tasks = self.get_tasks()
+        if not tasks:
+            self._backoff = min(max(self._backoff * 2, self.delay),
+                                self.max_delay)
             print('No current task')
-        time.sleep(self.delay)
+            self._stop.wait(self._backoff)
+            return
+        self._backoff = 0
+        for task in tasks:
+            self.process_task(task)
+        self.report_completed_tasks()
 
     def run(self):
         """Run in an infinite loop processing tasks."""
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self.reopen_logfile)
+        self._flusher = threading.Thread(target=self._flush_log_periodically,
+                                         daemon=True)
+        self._flusher.start()
         try:
             while True:
-                self.process_next_task()
+                self.process_next_batch()
         except KeyboardInterrupt:
-            pass
+            # don't leave tasks we already processed pending on the server
+            self.report_completed_tasks()
         except requests.exceptions.ConnectionError:
             print('Cannot connect to server.')
+        except requests.exceptions.Timeout:
+            print('Timed out waiting for server.')
+        finally:
+            self.close()
@@ -3,5 +3,17 @@ from pathlib import Path
 # Directory to be used to store pending tasks (one task per file)
 QUEUEDIR = Path(__file__).parent.parent.parent / 'data'
 
+# Keep an index of the tasks in QUEUEDIR in memory instead of reading the
+# directory on every request (only safe if a single server process is the
+# only thing using QUEUEDIR)
+QUEUE_INDEX = False
+
+# SQLite database to store pending tasks in, if set this is used instead
+# of QUEUEDIR
+QUEUEDB = None
+
 # Default priority for new tasks (a higher number is a higher priority)
 DEFAULT_PRIORITY = 100
+
+# Maximum number of tasks which can be retrieved in a single API request
+MAX_BATCH = 100
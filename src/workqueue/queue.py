@@ -1,17 +1,42 @@
 import calendar
+import heapq
 import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
 import time
 from datetime import datetime
-from functools import total_ordering
 from pathlib import Path
-from uuid import uuid4
+
+try:
+    from orjson import dumps as _json_dumps, loads as _json_loads
+except ImportError:
+    def _json_dumps(obj):
+        return json.dumps(obj).encode()
+    _json_loads = json.loads
+
+# Matches timestamps in QueueTask.timestamp_format, much faster than
+# parsing them with time.strptime
+_timestamp_re = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})$')
 
 
-@total_ordering
 class QueueTask(object):
     """Base class to represent a task object."""
+    __slots__ = ('payload', 'priority', 'exectime', 'datadir', 'id',
+                 '_sortkey', '_filename')
     sep = '_'
-    priority_fmt = '{:08}'
+    # Priorities are saved in filenames as max_priority - priority,
+    # zero padded to a fixed width, so that sorting filenames as strings
+    # puts higher priorities first.  The marker tells these apart from
+    # filenames in the old format, where the priority was saved as is.
+    priority_marker = 'p'
+    priority_fmt = priority_marker + '{:019}'
+    min_priority = -10**18
+    max_priority = 10**18
+    suffix = '.json'
     timestamp_format = '%Y-%m-%dT%H:%M:%S'
 
     def __init__(self, payload, priority, datadir, exectime=0, id=None):
@@ -23,20 +48,30 @@ class QueueTask(object):
         Args:
             payload: a string indicating what the task is
             priority: tiebreaker for tasks with the same execution time,
-                higher value means higher priority
+                higher value means higher priority (between min_priority
+                and max_priority)
             exectime: when to execute the task in unix time (the default
                 of 0 means ASAP)
             id: the id of the item, which will be a randomly generated
-                uuid if not given
+                128 bit hex string if not given
 
         """
+        if not self.min_priority <= priority <= self.max_priority:
+            raise ValueError('Priority must be between {} and {}'.format(
+                self.min_priority, self.max_priority))
         self.payload = payload
         self.priority = priority
         self.exectime = exectime
         self.datadir = datadir
         if id is None:
-            id = str(uuid4())
+            id = secrets.token_hex(16)
         self.id = id
+        # Tasks are ordered first by execution time then by priority.
+        # XXX Should we consider all tasks whose execution time has
+        # already passed to be equal in execution time, even if they
+        # weren't originally scheduled at the same time?
+        self._sortkey = (exectime, -priority)
+        self._filename = None
 
     def pretty_exectime(self):
         """Return a human readable timestamp of tasks's exectime."""
@@ -56,40 +91,69 @@ class QueueTask(object):
     @property
     def filename(self):
         """Return the canonical name where this task should be saved."""
-        timestamp = time.strftime(self.timestamp_format,
-                                  time.gmtime(self.exectime))
-        priority = self.priority_fmt.format(self.priority)
-        name = self.sep.join((timestamp, priority, str(self.id)))
-        return name + '.json'
+        if self._filename is None:
+            timestamp = time.strftime(self.timestamp_format,
+                                      time.gmtime(self.exectime))
+            priority = self.priority_fmt.format(
+                self.max_priority - self.priority)
+            name = self.sep.join((timestamp, priority, str(self.id)))
+            self._filename = name + self.suffix
+        return self._filename
 
     def save(self):
-        """Save this task to disk."""
-        serialized = json.dumps(self.asdict())
-        path = self.datadir / self.filename
-        path.write_text(serialized)
+        """Save this task to disk.
+
+        The task is written to a temporary file which is then renamed
+        into place, so that other threads and processes never see a
+        partially written task.
+
+        """
+        serialized = _json_dumps(self.asdict())
+        path = os.path.join(self.datadir, self.filename)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as fp:
+            fp.write(serialized)
+        os.replace(tmp_path, path)
 
     def delete(self):
         """Delete this task from disk."""
         path = self.datadir / self.filename
         path.unlink()
 
+    # All comparisons are defined directly rather than with
+    # functools.total_ordering, which adds an extra call to each one.
     def __lt__(self, other):
-        # Tasks are ordered first by execution time then by priority.
-        # XXX Should we consider all tasks whose execution time has
-        # already passed to be equal in execution time, even if they
-        # weren't originally scheduled at the same time?
-        return (self.priority > other.priority
-                if self.exectime == other.exectime
-                else self.exectime < other.exectime)
+        return self._sortkey < other._sortkey
+
+    def __le__(self, other):
+        return self._sortkey <= other._sortkey
+
+    def __gt__(self, other):
+        return self._sortkey > other._sortkey
+
+    def __ge__(self, other):
+        return self._sortkey >= other._sortkey
 
     def __eq__(self, other):
-        return (self.exectime == other.exectime and
-                self.priority == other.priority)
+        return self._sortkey == other._sortkey
+
+    def __ne__(self, other):
+        return self._sortkey != other._sortkey
+
+    def _fields(self):
+        # Read the slots through each class's own slot descriptor, so
+        # that e.g. FileQueueTask's lazy payload is not loaded from disk.
+        for cls in type(self).__mro__:
+            for key in getattr(cls, '__slots__', ()):
+                try:
+                    yield key, getattr(cls, key).__get__(self)
+                except AttributeError:
+                    pass
 
     def __str__(self):
         name = type(self).__name__
         args = ', '.join('{}={!r}'.format(key, value)
-                         for (key, value) in self.__dict__.items())
+                         for (key, value) in self._fields())
         return '{name}({args})'.format(name=name, args=args)
 
 
@@ -102,6 +166,7 @@ class FileQueueTask(QueueTask):
     needed.
 
     """
+    __slots__ = ('_payload',)
 
     def __init__(self, path):
         """Initialize a task from a path.
@@ -114,27 +179,41 @@ class FileQueueTask(QueueTask):
             path: The path to the saved task (a pathlib.Path object).
 
         """
-        self._filename = path.name
-        datadir = path.parent
-        stem = path.stem
+        self._init_from_name(path.name, path.parent)
+
+    @classmethod
+    def from_name(cls, name, datadir):
+        """Return a task given its filename and the directory it is in.
+
+        This is equivalent to initializing from datadir / name, without
+        the overhead of building and splitting a path.
+
+        """
+        task = cls.__new__(cls)
+        task._init_from_name(name, datadir)
+        return task
+
+    def _init_from_name(self, name, datadir):
+        stem = name[:-len(self.suffix)]
         timestamp, priority, id = stem.split(self.sep, 2)
-        exectime = calendar.timegm(time.strptime(timestamp,
-                                                 self.timestamp_format))
-        priority = int(priority)
+        fields = _timestamp_re.match(timestamp).groups()
+        exectime = calendar.timegm(tuple(map(int, fields)))
+        if priority.startswith(self.priority_marker):
+            priority = self.max_priority - int(priority[1:])
+        else:
+            # old format, see Queue.upgrade_filenames()
+            priority = int(priority)
         super().__init__(payload=None,
                          exectime=exectime, priority=priority, id=id,
                          datadir=datadir)
-
-    @property
-    def filename(self):
-        return self._filename
+        self._filename = name
 
     @property
     def payload(self):
         """Lazily load and return the payload for this task."""
         if self._payload is None:
             path = self.datadir / self.filename
-            data = json.loads(path.read_text())
+            data = _json_loads(path.read_bytes())
             self._payload = data['payload']
         return self._payload
 
@@ -147,13 +226,20 @@ class Queue(object):
     """Class representing a complete queue of pending tasks.
 
     The queue object does not save any state internally other than the
-    directory in which to store the pending tasks, and each task is
-    saved in a separate file which includes a UUID as part of the
-    filename to eliminate the possibility of a collision, thus it should
-    be safe to use in multiple threads and processes (to the degree that
-    the system's filesystem itself is thread and process safe).
+    directory in which to store the pending tasks (and a cached listing
+    of it, which is checked against the directory on every use), and
+    each task is saved in a separate file which includes a random id as part
+    of the filename to eliminate the possibility of a collision, thus it
+    should be safe to use in multiple threads and processes (to the
+    degree that the system's filesystem itself is thread and process
+    safe).
 
     """
+    # Directory modification times may have a coarse resolution, so a
+    # cached listing is only trusted if it was read at least this many
+    # nanoseconds after the directory was last modified.
+    mtime_resolution = 10**9
+
     def __init__(self, datadir):
         """Initialize the Queue.
 
@@ -161,40 +247,122 @@ class Queue(object):
             datadir: the directory in which pending tasks are stored
         """
         self.datadir = Path(datadir)
+        self._clear_cache()
+        self.upgrade_filenames()
+
+    def upgrade_filenames(self):
+        """Rename any tasks saved with filenames in the old format.
+
+        Tasks used to be saved with the priority as is rather than
+        inverted, so they wouldn't be sorted correctly together with
+        tasks saved in the current format.  This is called when the
+        queue is initialized.
+
+        """
+        try:
+            names = os.listdir(self.datadir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(QueueTask.suffix):
+                continue
+            parts = name[:-len(QueueTask.suffix)].split(QueueTask.sep, 2)
+            if (len(parts) != 3 or
+                    parts[1].startswith(QueueTask.priority_marker)):
+                continue
+            old_task = FileQueueTask.from_name(name, self.datadir)
+            task = QueueTask(payload=None, priority=old_task.priority,
+                             exectime=old_task.exectime, id=old_task.id,
+                             datadir=self.datadir)
+            try:
+                os.rename(os.path.join(self.datadir, name),
+                          os.path.join(self.datadir, task.filename))
+            except FileNotFoundError:
+                # another process upgraded it in the meantime
+                pass
+
+    def _clear_cache(self):
+        # (directory mtime, time the listing was read, tasks)
+        self._cache = (None, None, [])
 
     def items(self):
         """Return a list of pending tasks (in no particular order).
 
-        This is read from disk on every call.
+        The tasks are read from disk again whenever the directory has
+        been modified since the last call.
 
         """
-        return [FileQueueTask(path) for path in self.datadir.iterdir()]
+        mtime = os.stat(self.datadir).st_mtime_ns
+        cached_mtime, read_time, tasks = self._cache
+        if (mtime != cached_mtime or
+                read_time - mtime < self.mtime_resolution):
+            read_time = time.time_ns()
+            with os.scandir(self.datadir) as entries:
+                tasks = [FileQueueTask.from_name(entry.name, self.datadir)
+                         for entry in entries
+                         if entry.name.endswith(QueueTask.suffix) and
+                         entry.is_file()]
+            self._cache = (mtime, read_time, tasks)
+        return list(tasks)
+
+    def _names(self):
+        # skip anything that isn't a saved task, e.g. a temporary file
+        # of a task which is being saved
+        return [name for name in os.listdir(self.datadir)
+                if name.endswith(QueueTask.suffix)]
 
     def peek(self):
         """Return the next pending task, or None if the queue is empty."""
-        result = None
-        # iterating through the items is slightly faster than sorting
-        # and returning the first item, and works without change if the
-        # queue is empty
-        for item in self.items():
-            if result is None or item < result:
-                result = item
-        return result
+        # Filenames sort as strings in the same order as the tasks
+        # themselves, so only the winning file needs to be parsed.
+        name = min(self._names(), default=None)
+        if name is None:
+            return None
+        return FileQueueTask.from_name(name, self.datadir)
+
+    def peek_many(self, n):
+        """Return a sorted list of up to n of the next pending tasks."""
+        names = heapq.nsmallest(n, self._names())
+        return [FileQueueTask.from_name(name, self.datadir)
+                for name in names]
 
     def add(self, **kwds):
-        """Add a new task to the queue."""
+        """Add a new task to the queue and return it."""
         item = QueueTask(datadir=self.datadir, **kwds)
         item.save()
+        self._clear_cache()
+        return item
+
+    def add_many(self, kwds_list):
+        """Add several new tasks to the queue and return them.
+
+        Args:
+            kwds_list: an iterable of dicts of keyword arguments, one for
+                each task, as would be passed to add()
+        """
+        items = [QueueTask(datadir=self.datadir, **kwds)
+                 for kwds in kwds_list]
+        for item in items:
+            item.save()
+        self._clear_cache()
+        return items
 
     def delete_by_id(self, id):
         """Delete the task with the given id."""
-        for item in self.items():
-            if item.id == id:
-                try:
-                    item.delete()
-                except IOError:
-                    pass
-                return
+        # the id is the last part of the filename (and may itself
+        # contain the separator), so the file can be found without
+        # parsing every task
+        id_name = str(id) + QueueTask.suffix
+        with os.scandir(self.datadir) as entries:
+            for entry in entries:
+                parts = entry.name.split(QueueTask.sep, 2)
+                if len(parts) == 3 and parts[2] == id_name:
+                    try:
+                        os.unlink(entry.path)
+                    except IOError:
+                        pass
+                    self._clear_cache()
+                    return
         # ignore if not found or we get an error, maybe another
         # thread/process deleted it in the meantime
 
@@ -202,3 +370,192 @@ class Queue(object):
         name = type(self).__name__
         items = ', '.join(str(item) for item in self.items())
         return '<{name}: {items}>'.format(name=name, items=items)
+
+
+class IndexedQueue(Queue):
+    """Version of Queue which keeps an index of pending tasks in memory.
+
+    The directory is only read once, when the queue is initialized, and
+    after that the index is updated as tasks are added and deleted, so
+    finding the next task or listing the tasks doesn't touch the disk.
+    Since changes made to the directory by anything else won't be
+    noticed, this is only suitable if a single process is using the
+    queue (it is safe to use in multiple threads of that process).
+
+    """
+    def __init__(self, datadir):
+        """Initialize the IndexedQueue.
+
+        Args:
+            datadir: the directory in which pending tasks are stored
+        """
+        super().__init__(datadir)
+        self._lock = threading.Lock()
+        # The heap holds (filename, id) for all tasks ever added, tasks
+        # which were deleted are only dropped from it lazily, and
+        # _stale counts how many of those are left in it.  Filenames
+        # sort in the same order as the tasks themselves.
+        self._heap = []
+        self._tasks = {}
+        self._stale = 0
+        for task in super().items():
+            self._heap.append((task.filename, task.id))
+            self._tasks[task.id] = task
+        heapq.heapify(self._heap)
+
+    def _is_live(self, entry):
+        filename, id = entry
+        task = self._tasks.get(id)
+        return task is not None and task.filename == filename
+
+    def items(self):
+        """Return a list of pending tasks (in no particular order)."""
+        with self._lock:
+            return list(self._tasks.values())
+
+    def peek(self):
+        """Return the next pending task, or None if the queue is empty."""
+        with self._lock:
+            while self._heap and not self._is_live(self._heap[0]):
+                heapq.heappop(self._heap)
+                self._stale -= 1
+            if not self._heap:
+                return None
+            return self._tasks[self._heap[0][1]]
+
+    def peek_many(self, n):
+        """Return a sorted list of up to n of the next pending tasks."""
+        with self._lock:
+            entries = heapq.nsmallest(n + self._stale, self._heap)
+            return [self._tasks[entry[1]] for entry in entries
+                    if self._is_live(entry)][:n]
+
+    def add(self, **kwds):
+        """Add a new task to the queue and return it."""
+        item = super().add(**kwds)
+        with self._lock:
+            if item.id in self._tasks:
+                # replacing a task with the same id
+                self._stale += 1
+            heapq.heappush(self._heap, (item.filename, item.id))
+            self._tasks[item.id] = item
+        return item
+
+    def add_many(self, kwds_list):
+        """Add several new tasks to the queue and return them."""
+        items = super().add_many(kwds_list)
+        with self._lock:
+            for item in items:
+                if item.id in self._tasks:
+                    self._stale += 1
+                self._heap.append((item.filename, item.id))
+                self._tasks[item.id] = item
+            heapq.heapify(self._heap)
+        return items
+
+    def delete_by_id(self, id):
+        """Delete the task with the given id."""
+        with self._lock:
+            item = self._tasks.pop(id, None)
+            if item is None:
+                return
+            self._stale += 1
+        try:
+            item.delete()
+        except IOError:
+            pass
+
+
+class SqliteQueue(object):
+    """Class representing a queue of pending tasks stored in SQLite.
+
+    All tasks are stored in a single table with an index matching the
+    order in which tasks are to be dealt with, so finding the next task
+    does not require reading all of them.  The database is used in WAL
+    mode, so it may be shared by multiple processes, and within a
+    process a single connection is shared between threads.
+
+    """
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS tasks ('
+        'id TEXT PRIMARY KEY, payload TEXT, priority INTEGER, '
+        'exectime INTEGER)',
+        'CREATE INDEX IF NOT EXISTS tasks_order '
+        'ON tasks (exectime, priority DESC)',
+    )
+    _select = 'SELECT payload, priority, exectime, id FROM tasks'
+    _order = ' ORDER BY exectime, priority DESC'
+
+    def __init__(self, path):
+        """Initialize the SqliteQueue.
+
+        Args:
+            path: the database file in which pending tasks are stored,
+                which is created if it doesn't exist
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path),
+                                     check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            for statement in self._schema:
+                self._conn.execute(statement)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [QueueTask(payload=payload, priority=priority,
+                          exectime=exectime, id=id, datadir=None)
+                for (payload, priority, exectime, id) in rows]
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._conn:
+            self._conn.execute(sql, params)
+
+    def items(self):
+        """Return a list of pending tasks (in no particular order)."""
+        return self._query(self._select)
+
+    def peek(self):
+        """Return the next pending task, or None if the queue is empty."""
+        tasks = self.peek_many(1)
+        return tasks[0] if tasks else None
+
+    def peek_many(self, n):
+        """Return a sorted list of up to n of the next pending tasks."""
+        return self._query(self._select + self._order + ' LIMIT ?', (n,))
+
+    def add(self, **kwds):
+        """Add a new task to the queue and return it."""
+        item = QueueTask(datadir=None, **kwds)
+        self._execute(
+            'INSERT INTO tasks (payload, priority, exectime, id) '
+            'VALUES (?, ?, ?, ?)',
+            (item.payload, item.priority, item.exectime, item.id))
+        return item
+
+    def add_many(self, kwds_list):
+        """Add several new tasks to the queue in a single transaction."""
+        items = [QueueTask(datadir=None, **kwds) for kwds in kwds_list]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO tasks (payload, priority, exectime, id) '
+                'VALUES (?, ?, ?, ?)',
+                [(item.payload, item.priority, item.exectime, item.id)
+                 for item in items])
+        return items
+
+    def delete_by_id(self, id):
+        """Delete the task with the given id (if it exists)."""
+        self._execute('DELETE FROM tasks WHERE id = ?', (id,))
+
+    def close(self):
+        """Close the connection to the database."""
+        self._conn.close()
+
+    def __str__(self):
+        name = type(self).__name__
+        items = ', '.join(str(item) for item in self.items())
+        return '<{name}: {items}>'.format(name=name, items=items)
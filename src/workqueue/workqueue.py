@@ -3,10 +3,11 @@ import os
 import time
 from pathlib import Path
 
-from flask import Flask, request, render_template, url_for, redirect
+from flask import (Flask, request, render_template, url_for, redirect,
+                   abort)
 from flask.json import jsonify
 
-from .queue import Queue
+from .queue import QueueTask, Queue, IndexedQueue, SqliteQueue
 from . import default_settings
 
 app = Flask(__name__)
@@ -14,8 +15,14 @@ app.config.from_object(default_settings)
 if os.environ.get('WORKQUEUE_SETTINGS'):
     app.config.from_envvar('WORKQUEUE_SETTINGS')
 
-queue = Queue(app.config['QUEUEDIR'])
+if app.config['QUEUEDB']:
+    queue = SqliteQueue(app.config['QUEUEDB'])
+elif app.config['QUEUE_INDEX']:
+    queue = IndexedQueue(app.config['QUEUEDIR'])
+else:
+    queue = Queue(app.config['QUEUEDIR'])
 default_priority = app.config['DEFAULT_PRIORITY']
+max_batch = app.config['MAX_BATCH']
 
 
 @app.route('/')
@@ -47,6 +54,8 @@ def new():
         priority = int(request.form['priority'])
     except (ValueError, KeyError):
         priority = default_priority
+    priority = min(max(priority, QueueTask.min_priority),
+                   QueueTask.max_priority)
 
     formats = ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S')
     for fmt in formats:
@@ -74,14 +83,44 @@ def delete():
 
 @app.route('/api/next')
 def api_next():
-    """API endpoint for retrieving the next task."""
-    task = queue.peek()
-    task_json = task and task.asdict()
-    return jsonify(status='ok', task=task_json)
+    """API endpoint for retrieving the next task.
+
+    If an ``n`` query parameter is given, a list of up to that many of
+    the next tasks is returned instead (n must be between 1 and
+    MAX_BATCH).
+
+    """
+    if 'n' not in request.args:
+        task = queue.peek()
+        task_json = task and task.asdict()
+        return jsonify(status='ok', task=task_json)
+    n = request.args.get('n', type=int)
+    if n is None or not 1 <= n <= max_batch:
+        abort(400)
+    tasks_json = [task.asdict() for task in queue.peek_many(n)]
+    return jsonify(status='ok', tasks=tasks_json)
 
 
 @app.route('/api/complete', methods=['POST'])
 def api_complete():
-    """API endpoint for reporting on a completed task."""
-    task = queue.delete_by_id(request.json['id'])
+    """API endpoint for reporting on completed tasks.
+
+    Accepts either a single ``id`` or a list of ``ids``.
+
+    """
+    data = request.json
+    ids = data['ids'] if 'ids' in data else [data['id']]
+    for id in ids:
+        queue.delete_by_id(id)
+    return jsonify(status='ok')
+
+
+@app.route('/api/complete/<id>', methods=['POST'])
+def api_complete_id(id):
+    """API endpoint for reporting on a single completed task.
+
+    The id is given in the URL, so there is no request body to parse.
+
+    """
+    queue.delete_by_id(id)
     return jsonify(status='ok')
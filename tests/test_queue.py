@@ -1,8 +1,10 @@
 import json
+import os
 import random
 import time
 
-from workqueue.queue import QueueTask, FileQueueTask, Queue
+from workqueue.queue import (QueueTask, FileQueueTask, Queue, IndexedQueue,
+                             SqliteQueue)
 
 
 class TestQueue:
@@ -16,7 +18,7 @@ class TestQueue:
                          exectime=exectime, id=task_id,
                          datadir=tempdir)
 
-        filename = ('2017-07-14T02:40:00_00000100_'
+        filename = ('2017-07-14T02:40:00_p0999999999999999900_'
                     '5741fd6f-4388-482b-a7e1-5fc1c164c83e.json')
         assert filename == task.filename, \
             'Expected filename {}, got {}'.format(filename,
@@ -26,6 +28,7 @@ class TestQueue:
         path = tempdir / filename
         assert path.exists(), \
             'Expected task path {} not found'.format(path)
+        assert list(tempdir.iterdir()) == [path]
 
         content = json.loads(path.read_text())
         keys = ('payload', 'priority', 'exectime', 'id')
@@ -50,6 +53,12 @@ class TestQueue:
         assert task2 < task1
         assert task3 < task1
         assert task2 < task3
+        assert task1 > task2
+        assert task3 <= task1
+        assert task1 >= task3
+        assert task1 != task3
+        assert task1 == QueueTask(payload='other', priority=100,
+                                  datadir=tempdir, exectime=timestamp)
 
     def test_file_task(self, tempdir):
         task = QueueTask(payload='test', priority=500,
@@ -66,11 +75,21 @@ class TestQueue:
         assert loaded_task.priority == task.priority
         assert loaded_task.id == task.id
 
+        named_task = FileQueueTask.from_name(task.filename, tempdir)
+        assert named_task.filename == loaded_task.filename
+        assert named_task.payload == task.payload
+        assert named_task == loaded_task
+
         loaded_task.delete()
         assert not path.exists()
 
-    def run_queue_test(self, tempdir, task_kwds):
-        queue = Queue(tempdir)
+    def run_queue_test(self, tempdir, task_kwds, queue_class=Queue,
+                       check_files=True):
+        if check_files:
+            # a task which is still being saved
+            (tempdir / '0000-00-00T00:00:00_0_id.json.tmp').write_text('')
+        queue = queue_class(tempdir)
+        assert queue.peek() is None
 
         shuffled = list(task_kwds)
         random.shuffle(shuffled)
@@ -87,15 +106,23 @@ class TestQueue:
             for (key, val) in kwds.items():
                 assert getattr(task, key) == val
 
+        next_tasks = queue.peek_many(10)
+        assert ([task.id for task in next_tasks] ==
+                [task.id for task in sorted_tasks[::-1][:10]])
+
         randtask = random.choice(sorted_tasks)
         path = tempdir / randtask.filename
-        assert path.exists()
+        if check_files:
+            assert path.exists()
         queue.delete_by_id(randtask.id)
-        assert not path.exists()
-        for task in queue.items():
-            taskpath = tempdir / task.filename
-            if task.id != randtask.id:
-                assert taskpath.exists()
+        ids = [task.id for task in queue.items()]
+        assert len(ids) == len(task_kwds) - 1
+        assert randtask.id not in ids
+        if check_files:
+            assert not path.exists()
+            for task in queue.items():
+                assert (tempdir / task.filename).exists()
+        return queue
 
     def test_queue_priority(self, tempdir):
         timestamp = int(time.time() + 1000000)
@@ -112,3 +139,88 @@ class TestQueue:
                           payload='test {}'.format(i))
                      for i in range(100)]
         self.run_queue_test(tempdir, task_kwds)
+
+    def test_indexed_queue(self, tempdir):
+        timestamp = int(time.time() + 1000000)
+        task_kwds = [dict(priority=100+i,
+                          exectime=timestamp-i//2,
+                          payload='test {}'.format(i))
+                     for i in range(100)]
+        self.run_queue_test(tempdir, task_kwds, IndexedQueue)
+
+        # tasks already saved are indexed on initialization
+        queue = IndexedQueue(tempdir)
+        assert queue.peek().id == Queue(tempdir).peek().id
+        assert len(queue.items()) == len(task_kwds) - 1
+
+    def test_queue_add_many(self, tempdir):
+        task_kwds = [dict(priority=100+i, payload='test {}'.format(i))
+                     for i in range(10)]
+        queues = [Queue(tempdir), IndexedQueue(tempdir),
+                  SqliteQueue(tempdir / 'queue.db')]
+        for queue in queues:
+            added = queue.add_many(task_kwds)
+            assert len(added) == len(task_kwds)
+            assert ([task.id for task in queue.peek_many(len(task_kwds))] ==
+                    [task.id for task in reversed(added)])
+            for task in added:
+                queue.delete_by_id(task.id)
+            assert queue.peek() is None
+        queues[-1].close()
+
+    def test_queue_priority_range(self, tempdir):
+        priorities = [QueueTask.min_priority, -10**9, -5, 0, 100, 10**9,
+                      QueueTask.max_priority]
+        task_kwds = [dict(priority=priority, exectime=0,
+                          payload='test {}'.format(priority))
+                     for priority in priorities]
+        self.run_queue_test(tempdir, task_kwds)
+
+    def test_queue_upgrade_filenames(self, tempdir):
+        old_names = ['2017-07-14T02:40:00_00000100_old1.json',
+                     '2017-07-14T02:40:00_00000200_old2.json']
+        for name in old_names:
+            (tempdir / name).write_text(json.dumps(dict(payload=name)))
+        assert FileQueueTask(tempdir / old_names[0]).priority == 100
+
+        queue = Queue(tempdir)
+        queue.add(payload='new', priority=150, exectime=1500000000)
+        assert not any((tempdir / name).exists() for name in old_names)
+        assert ([task.payload for task in queue.peek_many(3)] ==
+                [old_names[1], 'new', old_names[0]])
+
+    def test_queue_delete_by_id(self, tempdir):
+        queue = Queue(tempdir)
+        ids = ['abc', 'x_abc', 'abc_x']
+        for id in ids:
+            queue.add(payload=id, priority=100, id=id)
+        queue.delete_by_id('abc')
+        assert sorted(task.id for task in queue.items()) == ['abc_x', 'x_abc']
+        queue.delete_by_id('x_abc')
+        assert [task.id for task in queue.items()] == ['abc_x']
+
+    def test_queue_items_cache(self, tempdir):
+        queue = Queue(tempdir)
+        other_queue = Queue(tempdir)
+        queue.add(payload='first', priority=100)
+        past = time.time_ns() - 10 * queue.mtime_resolution
+        os.utime(tempdir, ns=(past, past))
+
+        items = queue.items()
+        assert len(items) == 1
+        assert queue.items()[0] is items[0]
+
+        other_queue.add(payload='second', priority=100)
+        assert len(queue.items()) == 2
+
+    def test_sqlite_queue(self, tempdir):
+        timestamp = int(time.time() + 1000000)
+        task_kwds = [dict(priority=100+i,
+                          exectime=timestamp-i//2,
+                          payload='test {}'.format(i))
+                     for i in range(100)]
+        queue = self.run_queue_test(
+            tempdir, task_kwds,
+            lambda datadir: SqliteQueue(datadir / 'queue.db'),
+            check_files=False)
+        queue.close()
@@ -2,13 +2,11 @@ import re
 import time
 from unittest.mock import MagicMock
 
-import requests
-
 from queueworker.worker import Worker
 
 
 class TestWorker(object):
-    def test_worker_process_next_task(self, tempdir, monkeypatch):
+    def test_worker_process_next_batch(self, tempdir, monkeypatch):
         url = 'localhost/api'
         delay = 1
         logfile = tempdir / 'worker_log.txt'
@@ -16,26 +14,71 @@ class TestWorker(object):
         result_id = 'abc123'
         test_payload = 'test payload'
         result = dict(status='ok',
-                      task=dict(payload=test_payload,
-                                id=result_id))
+                      tasks=[dict(payload=test_payload,
+                                  id=result_id)])
         json_mock = MagicMock(return_value=result)
         result_mock = MagicMock(json=json_mock)
         get_mock = MagicMock(return_value=result_mock)
         post_mock = MagicMock()
 
-        monkeypatch.setattr(requests, 'get', get_mock)
-        monkeypatch.setattr(requests, 'post', post_mock)
-
         worker = Worker(url, delay, logfile)
+        monkeypatch.setattr(worker.session, 'get', get_mock)
+        monkeypatch.setattr(worker.session, 'post', post_mock)
 
         start = time.time()
-        worker.process_next_task()
-        assert time.time() - start >= delay
+        worker.process_next_batch()
+        assert time.time() - start < delay
+        worker.close()
 
-        get_mock.assert_called_with(url + '/next')
+        get_mock.assert_called_with(url + '/next',
+                                    params=dict(n=worker.batch_size),
+                                    timeout=worker.timeout)
         json_mock.assert_called_with()
         post_mock.assert_called_with(url + '/complete',
-                                     json=dict(id=result_id))
+                                     json=dict(ids=[result_id]),
+                                     timeout=worker.timeout)
 
         logline_re = r'^\d+-\d+-\d+T\d+:\d+:\d+: {}$'.format(test_payload)
         assert re.search(logline_re, logfile.read_text().strip())
+
+    def test_worker_backoff(self, tempdir, monkeypatch):
+        delay = 0.1
+        max_delay = 0.3
+        logfile = tempdir / 'worker_log.txt'
+
+        results = [[], [], [], [], [dict(payload='test', id='abc123')], []]
+        result_mock = MagicMock(json=MagicMock(
+            side_effect=[dict(status='ok', tasks=tasks)
+                         for tasks in results]))
+
+        worker = Worker('localhost/api', delay, logfile,
+                        max_delay=max_delay)
+        monkeypatch.setattr(worker.session, 'get',
+                            MagicMock(return_value=result_mock))
+        monkeypatch.setattr(worker.session, 'post', MagicMock())
+
+        waits = []
+        for expected in (0.1, 0.2, 0.3, 0.3, 0, 0.1):
+            start = time.time()
+            worker.process_next_batch()
+            waits.append(time.time() - start)
+            assert worker._backoff == expected
+        assert waits[2] >= max_delay
+        assert waits[4] < delay
+        worker.close()
+
+    def test_worker_log_flush(self, tempdir):
+        logfile = tempdir / 'worker_log.txt'
+        worker = Worker('localhost/api', 0, logfile)
+
+        worker.writeline('first')
+        assert logfile.read_text() == ''
+        worker.flush_log()
+        assert logfile.read_text().endswith(': first\n')
+
+        for i in range(worker.log_flush_lines):
+            worker.writeline('line {}'.format(i))
+        lines = logfile.read_text().splitlines()
+        assert len(lines) == worker.log_flush_lines + 1
+
+        worker.close()
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from workqueue import workqueue
+from workqueue.queue import QueueTask, Queue
+
+
+@pytest.fixture
+def client(tempdir, monkeypatch):
+    monkeypatch.setattr(workqueue, 'queue', Queue(tempdir))
+    return workqueue.app.test_client()
+
+
+class TestWorkqueue:
+    def test_api_next_batch(self, client):
+        for i in range(5):
+            workqueue.queue.add(payload='test {}'.format(i), priority=100+i)
+
+        result = json.loads(client.get('/api/next?n=3').data)
+        assert ([task['payload'] for task in result['tasks']] ==
+                ['test 4', 'test 3', 'test 2'])
+
+        for n in ('0', '-1', str(workqueue.max_batch + 1), 'abc'):
+            response = client.get('/api/next?n=' + n)
+            assert response.status_code == 400
+
+    def test_new_priority(self, client):
+        for priority in ('-5', str(10**30), 'abc'):
+            client.post('/new', data=dict(payload=priority,
+                                          priority=priority, exectime=''))
+        priorities = {task.payload: task.priority
+                      for task in workqueue.queue.items()}
+        assert priorities == {'-5': -5,
+                              str(10**30): QueueTask.max_priority,
+                              'abc': workqueue.default_priority}
+
+    def test_api_complete_id(self, client):
+        ids = [workqueue.queue.add(payload='test {}'.format(i),
+                                   priority=100).id
+               for i in range(3)]
+
+        response = client.post('/api/complete/' + ids[1])
+        assert json.loads(response.data) == dict(status='ok')
+        assert (sorted(task.id for task in workqueue.queue.items()) ==
+                sorted([ids[0], ids[2]]))
+
+        response = client.post('/api/complete/unknown')
+        assert json.loads(response.data) == dict(status='ok')
+        assert len(workqueue.queue.items()) == 2